@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Everything run_fuse does before handing over to FUSE, with --fast-start
+CLIENT = """
+import time
+start = time.perf_counter()
+from dfsfuse.dfsfuse import DFSFuse, Client
+Client(host="127.0.0.1", port=1, lazy=True)
+print(time.perf_counter() - start)
+"""
+
+
+def run_cli():
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, os.path.join(ROOT, "dfsfuse.py"), "--help"],
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def run_client():
+    out = subprocess.run(
+        [sys.executable, "-c", CLIENT],
+        cwd=ROOT,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    )
+    return float(out.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure startup time")
+    parser.add_argument("-n", "--runs", help="Runs", default=10, type=int)
+    parser.add_argument(
+        "--budget", help="Fail if a median exceeds this many ms", type=float
+    )
+    args = parser.parse_args()
+
+    slow = False
+    for name, func in (("cli", run_cli), ("client", run_client)):
+        ms = statistics.median(func() for _ in range(args.runs)) * 1000
+        print("{0}: {1:.1f} ms".format(name, ms))
+        if args.budget is not None and ms > args.budget:
+            slow = True
+    sys.exit(1 if slow else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 # encoding: utf-8
 
 from sys import argv
-from dfsfuse import main
+from dfsfuse.main import main
 
 if __name__ == '__main__':
     main(argv)
@@ -5,45 +5,132 @@ import collections
 import hashlib
 import socket
 import json
+import time
+from io import BytesIO
 from functools import wraps
-from hirlite import Rlite
+from threading import BoundedSemaphore, Lock, Thread, local
 from .packet import Packet
 from .memoryfs import MemoryFS
+from .pool import ConnectionPool
+from .spool import SpoolFile
+from .utils.backoff import Backoff
+from .utils.circuit import CircuitBreaker
 from .exception import (
+    DFSError,
     TimeoutError,
     ServerError,
     DisconnectError,
+    CircuitOpenError,
     AuthError,
 )
 
 
 logger = getLogger("Client")
-socket.setdefaulttimeout(5)
 
 
 def inject_socket(func):
     @wraps(func)
     def _wrapper(*args, **kargs):
         self = args[0]
-        sock = self._connect()
-        res = func(self, sock, *args[1:])
-        sock.close()
+        self._breaker.check()
+        try:
+            for attempt in range(2):
+                received = self._received()
+                reused = False
+                try:
+                    with self._pool.connection(fresh=attempt > 0) as (sock, reused):
+                        res = func(self, sock, *args[1:], **kargs)
+                    break
+                except (DisconnectError, ConnectionError):
+                    # An idle connection can be closed by the server right after
+                    # the pool checked it, nothing was answered so retry once
+                    if attempt or not reused or self._received() != received:
+                        raise
+                    logger.info("Pooled connection closed, retry on a new one")
+        except (DisconnectError, ConnectionError, TimeoutError):
+            self._breaker.failure()
+            raise
+        self._breaker.success()
+        self._backoff.reset()
         return res
 
     return _wrapper
 
 
+def limit_transfer(func):
+    @wraps(func)
+    def _wrapper(*args, **kargs):
+        with args[0]._transfers:
+            return func(*args, **kargs)
+
+    return _wrapper
+
+
+def _encode(content):
+    if type(content) is str:
+        return content.encode("utf-8")
+    return content
+
+
 class Client:
-    def __init__(self, host="localhost", port=4096, psk="", cache=True):
+    def __init__(
+        self,
+        host="localhost",
+        port=4096,
+        psk="",
+        cache=True,
+        timeout=5,
+        chunk_size=256 * 1024,
+        parallel=4,
+        min_staleness=5,
+        max_staleness=30,
+        pipeline=1,
+        prefetch=32,
+        prefetch_size=64 * 1024,
+        spool_size=8 * 1024 * 1024,
+        spool_dir=None,
+        lazy=False,
+    ):
         logger.info("Initialize")
         self._host = host
         self._port = port
         self._psk = hashlib.md5(psk.encode("utf-8")).hexdigest()
-        self._rlite = Rlite()
+        self._rlite_db = None
+        self._rlite_lock = Lock()
         self._cache = cache
+        self._timeout = timeout
+        self._chunk_size = chunk_size
+        self._min_staleness = min_staleness
+        self._max_staleness = max_staleness
+        self._parallel = parallel
+        self._pipeline = pipeline
+        self._prefetch = prefetch
+        self._prefetch_size = prefetch_size
+        self._spool_size = spool_size
+        self._spool_dir = spool_dir
+        self._last_open = {}
+        self._inflight = set()
+        self._inflight_lock = Lock()
+        self._executor_pool = None
+        self._executor_lock = Lock()
+        self._transfers = BoundedSemaphore(parallel)
+        self._local = local()
+        self._pool = ConnectionPool(self._connect, size=parallel)
+        self._backoff = Backoff()
+        self._breaker = CircuitBreaker()
+        self._revalidating = Lock()
+        self._root_lock = Lock()
         self._fs = MemoryFS()
-        self._connect()
-        self._init()
+        if lazy:
+            # Mount right away, root is listed in background or on first access
+            Thread(target=self._preload, daemon=True).start()
+        else:
+            try:
+                self._ensure_root()
+            except DisconnectError:
+                sys.exit("Connection fail")
+        if self._cache:
+            Thread(target=self._schedule, daemon=True).start()
 
     @inject_socket
     def login(self, sock):
@@ -69,8 +156,19 @@ class Client:
             return self._fs.getmeta(path)
         raise TypeError("Path not exist")
 
-    @inject_socket
-    def has(self, sock, path):
+    @property
+    def _rlite(self):
+        # Loaded on first use to keep hirlite off the startup path
+        if self._rlite_db is None:
+            with self._rlite_lock:
+                if self._rlite_db is None:
+                    from hirlite import Rlite
+
+                    self._rlite_db = Rlite()
+        return self._rlite_db
+
+    def has(self, path):
+        self._ensure_root()
         deque = collections.deque()
         cur_path = path
 
@@ -88,19 +186,22 @@ class Client:
             parent_path = cur_path
             logger.info("has: Recursive find file: cur_path: %s", cur_path)
             cur_path = os.path.join(cur_path, deque.popleft())
-            if not self._fs.has(cur_path):
+            self._touch(parent_path)
+            if not self._fs.has(cur_path) or self._stale(parent_path):
                 if self._fs.isdir(parent_path):
                     self.readdir(parent_path)
                 else:
                     break
         return self._fs.has(path)
 
+    @limit_transfer
     @inject_socket
     def write(self, sock, path, content):
         parent_path = os.path.dirname(path)
         if not self._fs.isdir(parent_path):
             raise RuntimeError("Write: path is not dir")
 
+        content = _encode(content)
         name = os.path.basename(path)
         id = self._fs.getid(parent_path)
         logger.info("Write to %s, content len %s", path, len(content))
@@ -110,20 +211,216 @@ class Client:
         if body != b"OK":
             raise ServerError("Write fail")
         self._readdir(sock, parent_path)
-        self._fs.loadfile(path, content)
+        self._keep(path, content)
+        return True
+
+    def write_many(self, files):
+        # For callers holding many files at once. DFSFuse doesn't use it:
+        # release has to report the error of its own file to close(), so it
+        # can't wait to be batched with others
+        files = {path: _encode(content) for path, content in files.items()}
+        parents = set()
+        for path in files:
+            parent_path = os.path.dirname(path)
+            if not self._fs.isdir(parent_path):
+                raise RuntimeError("Write: path is not dir")
+            parents.add(parent_path)
+        self._batch(self._put_group, list(files.items()))
+        # One listing per directory instead of one per file
+        for parent_path in parents:
+            self._refresh(parent_path)
+        for path, content in files.items():
+            self._keep(path, content)
         return True
 
+    @limit_transfer
     @inject_socket
-    def read(self, sock, path):
+    def _put_group(self, sock, files):
+        requests = []
+        for path, content in files:
+            logger.info("Write to %s, content len %s", path, len(content))
+            header = {
+                "id": self._fs.getid(os.path.dirname(path)),
+                "name": os.path.basename(path),
+            }
+            requests.append(("file#put", header, content))
+        for _, body in self.request_many(sock, requests):
+            if body != b"OK":
+                raise ServerError("Write fail")
+        return {}
+
+    def read(self, path):
         if not self._fs.isfile(path):
             return None
+        if self._fresh(os.path.dirname(path)) and self._fs.hascontent(path):
+            return self._fs.getcontent(path)
+        content = self._read(path)
+        if self._scanning(path):
+            self._prefetch_siblings(path)
+        return content
+
+    def read_many(self, paths):
+        paths = [path for path in paths if self._fs.isfile(path)]
+        return self._batch(self._get_group, paths)
+
+    @limit_transfer
+    @inject_socket
+    def _get_group(self, sock, paths, best_effort=False):
+        requests = [("file#get", {"id": self._fs.getid(path)}, b"") for path in paths]
+        # A write may replace a file while its old content is in flight
+        versions = [self._fs.getversion(path) for path in paths]
+        responses = self.request_many(sock, requests)
+        contents = {}
+        for path, version, (header, body) in zip(paths, versions, responses):
+            if header["result"] != "OK":
+                if not best_effort:
+                    raise ServerError("Read fail")
+                logger.info("Skip %s: read fail", path)
+                continue
+            self._keep(path, body, version)
+            contents[path] = body
+        return contents
+
+    def _prefetch_siblings(self, path):
+        # Off the critical path of the open, a failure only costs the prefetch
+        with self._inflight_lock:
+            siblings = [p for p in self._siblings(path) if p not in self._inflight]
+            self._inflight.update(siblings)
+        if not siblings:
+            return
+        logger.info("Prefetch %s siblings of %s", len(siblings), path)
+        for group in self._groups(siblings):
+            future = self._executor.submit(self._get_group, group, best_effort=True)
+            future.add_done_callback(self._prefetched(group))
+
+    def _prefetched(self, group):
+        def _done(future):
+            with self._inflight_lock:
+                self._inflight.difference_update(group)
+            if future.exception() is not None:
+                logger.error("Prefetch fail: %s", future.exception())
+
+        return _done
+
+    def _batch(self, func, items):
+        results = {}
+        for contents in self._executor.map(func, self._groups(items)):
+            results.update(contents)
+        return results
+
+    def _groups(self, items):
+        # Spread over the pooled connections, each one sends its share in
+        # pipelined windows
+        workers = max(1, min(self._parallel, len(items)))
+        return [items[i::workers] for i in range(workers)]
+
+    @property
+    def _executor(self):
+        # Shared by batches and prefetch, created on first use to keep
+        # concurrent.futures off the startup path
+        if self._executor_pool is None:
+            with self._executor_lock:
+                if self._executor_pool is None:
+                    from concurrent.futures import ThreadPoolExecutor
+
+                    self._executor_pool = ThreadPoolExecutor(self._parallel)
+        return self._executor_pool
+
+    def _scanning(self, path):
+        if not self._cache or not self._prefetch:
+            return False
+        parent_path, name = os.path.split(path)
+        last = self._last_open.get(parent_path)
+        self._last_open[parent_path] = name
+        return last is not None and last != name
+
+    def _siblings(self, path):
+        parent_path, name = os.path.split(path)
+        siblings = []
+        for child in sorted(self._fs.readdir(parent_path)):
+            child_path = os.path.join(parent_path, child)
+            if child <= name or not self._fs.isfile(child_path):
+                continue
+            if self._fs.hascontent(child_path):
+                continue
+            if self._fs.getmeta(child_path).get("size", 0) > self._prefetch_size:
+                continue
+            siblings.append(child_path)
+            if len(siblings) >= self._prefetch:
+                break
+        return siblings
+
+    @limit_transfer
+    @inject_socket
+    def _read(self, sock, path):
         id = self._fs.getid(path)
+        version = self._fs.getversion(path)
         header, body = self.request(sock, "file#get", header={"id": id})
         if header["result"] != "OK":
             raise ServerError("Read fail")
-        self._fs.loadfile(path, body)
+        self._keep(path, body, version)
         return body
 
+    def version(self, path):
+        # None when there is no cache that could tell a change apart
+        if not self._cache or not self.has(path):
+            return None
+        return self._fs.getversion(path)
+
+    def spooled(self, path):
+        if not self._fs.isfile(path):
+            return False
+        return self._fs.getmeta(path).get("size", 0) > self._spool_size
+
+    @limit_transfer
+    @inject_socket
+    def read_spool(self, sock, path):
+        id = self._fs.getid(path)
+        self._send(sock, self._packet("file#get", {"id": id}))
+        pkt = self._read_header(sock)
+        if not pkt:
+            raise DisconnectError("connection lost")
+        if pkt.headers["result"] != "OK":
+            raise ServerError("Read fail")
+        length = int(pkt.get("content-length"))
+        logger.info("Spool %s, content len %s", path, length)
+        spool = SpoolFile(length, dir=self._spool_dir)
+        try:
+            # Receive straight into the mapping, the body never lives in memory
+            with spool.getbuffer() as view:
+                received = len(pkt.body)
+                view[:received] = pkt.body
+                while received < length:
+                    end = min(length, received + self._chunk_size)
+                    n = self._recv_into(sock, view[received:end])
+                    if n == 0:
+                        raise DisconnectError("connection lost")
+                    received += n
+        except BaseException:
+            spool.close()
+            raise
+        self._fs.unloadfile(path)
+        return spool
+
+    def spill(self, io):
+        # A handle written past the threshold moves from the heap to a spool
+        if type(io) is not BytesIO or io.tell() <= self._spool_size:
+            return io
+        with io.getbuffer() as content:
+            logger.info("Spill handle, content len %s", len(content))
+            spool = SpoolFile(len(content), dir=self._spool_dir)
+            spool.write(content)
+        io.close()
+        return spool
+
+    def _keep(self, path, content, version=None):
+        if len(content) > self._spool_size:
+            self._fs.unloadfile(path)
+        else:
+            if type(content) is memoryview:
+                content = content.tobytes()
+            self._fs.loadfile(path, content, version)
+
     @inject_socket
     def rm(self, sock, path):
         if not self._fs.isfile(path):
@@ -147,9 +444,12 @@ class Client:
             raise RuntimeError("target {0} not exist".format(head))
         parent_id = self._fs.getid(head)
         if meta["type"] == "file":
-            return self._mvfile(sock, id, parent_id, tail)
+            self._mvfile(sock, id, parent_id, tail)
         else:
-            return self._mvdir(sock, id, parent_id, tail)
+            self._mvdir(sock, id, parent_id, tail)
+        for parent_path in {os.path.dirname(old), head}:
+            self._readdir(sock, parent_path)
+        return True
 
     def _mvfile(self, sock, id, parent_id, name):
         _, body = self.request(
@@ -167,14 +467,14 @@ class Client:
             raise ServerError("mvdir fail")
         return True
 
-    @inject_socket
-    def readdir(self, sock, path):
-        cache_key = "{0}:cache".format(path)
-        if self._cache and self._rlite.exists(cache_key):
-            dirents = self._fs.readdir(sock, path)
+    def readdir(self, path):
+        self._ensure_root()
+        self._touch(path)
+        if self._fresh(path) and self._fs.isloaded(path):
+            dirents = [".", ".."] + self._fs.readdir(path)
             logger.info("cached dirents: %s", dirents)
             return dirents
-        return self._readdir(sock, path)
+        return self._refresh(path)
 
     def _readdir(self, sock, path):
         logger.info("_readdir path: %s", path)
@@ -182,15 +482,69 @@ class Client:
         self._rlite.expire(cache_key, "0")
         id = self._fs.getid(path)
         logger.info("_readdir id: %s", id)
-        data = self._readdir_with_id(sock, id)
-        self._fs.adddir(path, data)
-        return data.keys()
+        body = self._list(sock, id)
+        # dir#list has no conditional form, compare digests to skip the update
+        digest = hashlib.md5(body).hexdigest()
+        old_digest = self._rlite.getset("{0}:digest".format(path), digest)
+        if old_digest == digest.encode("utf-8") and self._fs.isloaded(path):
+            logger.info("_readdir: %s unchanged", path)
+        else:
+            self._fs.adddir(path, json.loads(body.decode("utf-8")))
+        if self._cache:
+            ttl = int(self._max_staleness * 1000)
+            self._rlite.psetex(cache_key, str(ttl), "1")
+        return [".", ".."] + self._fs.readdir(path)
 
     def _readdir_with_id(self, sock, id=None):
-        _, body = self.request(sock, "dir#list", header={"id": id})
-        data = json.loads(body.decode("utf-8"))
+        data = json.loads(self._list(sock, id).decode("utf-8"))
         return data
 
+    def _list(self, sock, id):
+        _, body = self.request(sock, "dir#list", header={"id": id})
+        return body
+
+    def _fresh(self, path):
+        return self._cache and self._rlite.exists("{0}:cache".format(path))
+
+    def _stale(self, path):
+        # Without the cache there is no age to tell, only a miss re-lists
+        return self._cache and not self._fresh(path)
+
+    def _touch(self, path):
+        if self._cache:
+            self._rlite.incr("{0}:hits".format(path))
+
+    def _age(self, path):
+        ttl = self._rlite.pttl("{0}:cache".format(path))
+        if ttl < 0:
+            return float("inf")
+        return self._max_staleness - ttl / 1000
+
+    def _schedule(self):
+        # Refresh directories used since the last round before they go stale,
+        # unused ones expire and are listed again on the next access
+        while True:
+            time.sleep(self._min_staleness)
+            # Nothing may end this thread, the staleness bound depends on it
+            try:
+                self._schedule_round()
+            except Exception:
+                logger.exception("Revalidation round fail")
+
+    def _schedule_round(self):
+        due = []
+        for path in self._fs.dirs():
+            if self._age(path) < self._min_staleness:
+                continue
+            hits = int(self._rlite.getset("{0}:hits".format(path), "0") or 0)
+            if hits:
+                due.append((hits, path))
+        if not due or not self._revalidating.acquire(blocking=False):
+            return
+        due.sort(reverse=True)
+        logger.info("Revalidate %s dirs", len(due))
+        self._revalidate([path for _, path in due])
+
     @inject_socket
     def mkdir(self, sock, path, name):
         parent_id = self._fs.getid(path)
@@ -205,30 +559,58 @@ class Client:
         _, body = self.request(sock, "dir#rm", header={"id": id})
         if body != b"OK":
             raise ServerError("Rmdir fail")
-        self._readdir(sock, path)
+        self._readdir(sock, os.path.dirname(path))
         return True
 
     def request(self, sock, request, body=b"", header={}):
-        controller, action = request.split("#")
-        logger.info("Request: action: %s, header: %s", action, header)
-        _header = {"controller": controller, "action": action}
-        _header.update(header)
-        self._send(sock, Packet(_header, body))
+        self._send(sock, self._packet(request, header, body))
         pkt = self._read_response(sock)
         if not pkt:
             raise DisconnectError("connection lost")
         return (pkt.headers, pkt.body)
 
+    def request_many(self, sock, requests):
+        responses = []
+        # Bytes past a response belong to the next one, even across windows
+        rest = b""
+        for start in range(0, len(requests), self._pipeline):
+            end = start + self._pipeline
+            window = requests[start:end]
+            for request, header, body in window:
+                self._send(sock, self._packet(request, header, body))
+            for _ in window:
+                pkt = self._read_response(sock, rest)
+                if not pkt:
+                    raise DisconnectError("connection lost")
+                responses.append((pkt.headers, pkt.body))
+                rest = pkt.rest
+        return responses
+
+    def _packet(self, request, header, body=b""):
+        controller, action = request.split("#")
+        logger.info("Request: action: %s, header: %s", action, header)
+        _header = {"controller": controller, "action": action}
+        _header.update(header)
+        return Packet(_header, body)
+
     @inject_socket
     def send(self, sock, packet):
         if type(packet) is not Packet:
             raise TypeError("Must be Packet")
         self._send(sock, packet)
 
-    def _init(self):
-        self._fs.reset()
-        self._rlite.flushall()
-        self._init_root()
+    def _ensure_root(self):
+        if self._fs.has("/"):
+            return
+        with self._root_lock:
+            if not self._fs.has("/"):
+                self._init_root()
+
+    def _preload(self):
+        try:
+            self._ensure_root()
+        except (DFSError, OSError) as err:
+            logger.error("Preload root fail, retry on first access: %s", err)
 
     @inject_socket
     def _init_root(self, sock):
@@ -237,47 +619,101 @@ class Client:
         self._fs.adddir("/", data)
 
     def _send(self, sock, packet):
-        data = packet.to_bytes()
         logger.info("_send: Send: %s", packet.headers)
-        sock.sendall(data)
+        sock.sendall(packet.header_bytes())
+        # The timeout of sendall covers the whole call, so send the body in
+        # chunks to make a slow but alive transfer not time out
+        body = memoryview(packet.body_bytes())
+        for start in range(0, len(body), self._chunk_size):
+            end = start + self._chunk_size
+            sock.sendall(body[start:end])
 
     def reconnect(self):
-        self._init()
+        # Only the connections are broken, the cache is no staler than before
+        # and the scheduler keeps revalidating it as usual
+        self._pool.clear()
+        self._breaker.check()
+        delay = self._backoff.next()
+        logger.info("Reconnect in %.2fs", delay)
+        time.sleep(delay)
+
+    def _revalidate(self, paths):
+        try:
+            for path in paths:
+                if not self._fs.isdir(path):
+                    continue
+                try:
+                    self._refresh(path)
+                except CircuitOpenError:
+                    logger.error("Revalidate: server unavailable")
+                    break
+                except KeyError:
+                    logger.info("Revalidate: %s vanished", path)
+                except (DFSError, OSError, ValueError) as err:
+                    logger.error("Revalidate %s fail: %s", path, err)
+        finally:
+            self._revalidating.release()
+
+    @inject_socket
+    def _refresh(self, sock, path):
+        return self._readdir(sock, path)
 
     def _connect(self):
         logger.info("Create connection")
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self._timeout)
         try:
             sock.connect((self._host, self._port))
-        except ConnectionError:
-            logger.error("Connection fail")
-            sys.exit("Connection fail")
+        except OSError as err:
+            # Refused, unreachable or timed out, all mean the server is away
+            logger.error("Connection fail: %s", err)
+            sock.close()
+            raise DisconnectError("Connection fail")
         return sock
 
     def close(self):
-        pass
+        self._pool.clear()
 
-    def _read_response(self, sock):
+    def _read_response(self, sock, buf=b""):
         logger.info("Read response")
+        pkt = self._read_header(sock, buf)
+        if not pkt:
+            return None
+        while not pkt.check():
+            data = self._recv(sock)
+            if len(data) == 0:
+                return None
+            pkt = Packet.parse(pkt, data)
+        return pkt
+
+    def _read_header(self, sock, buf=b""):
+        # Pipelined responses may share a recv, buf is what the last one left
+        while b"\n\n" not in buf:
+            data = self._recv(sock)
+            if len(data) == 0:
+                return None
+            buf += data
+        return Packet.parse(None, buf)
+
+    def _recv_into(self, sock, view):
         try:
-            buf = sock.recv(4096)
+            n = sock.recv_into(view)
         except socket.timeout:
             raise TimeoutError()
-        if len(buf) == 0:
-            return None
-        pkt = Packet.parse(None, buf)
-        while True:
-            if not pkt:
-                break
-            if not pkt.check():
-                try:
-                    buf = sock.recv(4096)
-                except socket.timeout:
-                    raise TimeoutError()
-                if len(buf) == 0:
-                    pkt = None
-                    break
-                pkt = Packet.parse(pkt, buf)
-            else:
-                break
-        return pkt
+        self._count(n)
+        return n
+
+    def _recv(self, sock):
+        try:
+            data = sock.recv(self._chunk_size)
+        except socket.timeout:
+            raise TimeoutError()
+        self._count(len(data))
+        return data
+
+    def _received(self):
+        # Bytes received by this thread, tells if a request got any answer
+        return getattr(self._local, "received", 0)
+
+    def _count(self, n):
+        self._local.received = self._received() + n
@@ -3,7 +3,13 @@ from types import FunctionType
 from functools import wraps
 from logging import getLogger
 from fuse import FuseOSError
-from .exception import TimeoutError, ServerError, InternalError, DisconnectError
+from .exception import (
+    TimeoutError,
+    ServerError,
+    InternalError,
+    DisconnectError,
+    CircuitOpenError,
+)
 
 logger = getLogger("decorator")
 
@@ -15,9 +21,12 @@ def retryable(func):
         while retry < 3:
             try:
                 return func(*args, **kargs)
+            except CircuitOpenError:
+                logger.error("Server unavailable, fail fast")
+                raise FuseOSError(errno.EIO)
             except (DisconnectError, ConnectionError):
                 logger.error("Connection lost, retry %s", retry)
-                args[0]._client.reconnect()
+                _reconnect(args[0]._client)
                 retry += 1
         logger.error("Too many retries")
         raise FuseOSError(errno.EIO)
@@ -30,14 +39,25 @@ def nonretryable(func):
     def _wrapper(*args, **kargs):
         try:
             return func(*args, **kargs)
+        except CircuitOpenError:
+            logger.error("Server unavailable, fail fast")
+            raise FuseOSError(errno.EIO)
         except (DisconnectError, ConnectionError):
             logger.error("Connection lost, not retryable, reconnecting...")
-            args[0]._client.reconnect()
+            _reconnect(args[0]._client)
             raise FuseOSError(errno.EIO)
 
     return _wrapper
 
 
+def _reconnect(client):
+    try:
+        client.reconnect()
+    except CircuitOpenError:
+        logger.error("Server unavailable, stop retrying")
+        raise FuseOSError(errno.EIO)
+
+
 def _catch_exceptions(func):
     @wraps(func)
     def _wrapper(*args, **kargs):
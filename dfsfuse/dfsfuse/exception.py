@@ -20,3 +20,7 @@ class DisconnectError(DFSError):
 
 class AuthError(DFSError):
     pass
+
+
+class CircuitOpenError(DisconnectError):
+    pass
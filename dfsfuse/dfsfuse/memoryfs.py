@@ -13,7 +13,7 @@ class MemoryFS:
         self.reset()
 
     def reset(self):
-        with self._lock_with_log:
+        with self._lock_with_log():
             self._meta = {}
             self._paths = {}
 
@@ -42,48 +42,103 @@ class MemoryFS:
     def isfile(self, path):
         return self.has(path) and self._meta[path]["type"] == "file"
 
+    def isloaded(self, path):
+        return self.isdir(path) and "children" in self._meta[path]
+
     def adddir(self, path, content):
         logger.info("adddir: path: %s, content: %s", path, content)
         if path == "/":
             assert content["."]["id"] == 1
-        with self._lock_with_log:
-            self._meta[path] = content["."]
-            self._meta[path]["children"] = set()
-
-            for name, meta in content.items():
-                if name == ".." or name == ".":
-                    continue
-                child_path = os.path.join(path, name)
-                self._paths[child_path] = meta
-                self._meta[path]["children"].add(name)
-                self._meta[child_path] = meta
+        # Readers don't lock, so build the listing completely and publish it
+        # with a single assignment, a published children set never changes
+        meta = dict(content["."])
+        meta["children"] = {name for name in content if name not in (".", "..")}
+        with self._lock_with_log():
+            old = self._meta.get(path, {})
+            for name in meta["children"]:
+                self._update(os.path.join(path, name), content[name])
+
+            for name in old.get("children", set()) - meta["children"]:
+                self._remove(os.path.join(path, name))
+            self._meta[path] = meta
         assert self._meta["/"]["id"] == 1
 
-    def loadfile(self, path, content):
+    def dirs(self):
+        with self._lock_with_log():
+            return [path for path, meta in self._meta.items() if "children" in meta]
+
+    def loadfile(self, path, content, version=None):
         if not self.isfile(path):
             raise TypeError("Path is not file")
-        with self._lock_with_log:
-            self._meta[path]["content"] = content
+        with self._lock_with_log():
+            meta = self._meta[path]
+            # Content requested before a newer listing belongs to an old file
+            if version is not None and _version(meta) != version:
+                logger.info("loadfile: %s changed, drop content", path)
+                return False
+            meta["content"] = content
+            return True
+
+    def unloadfile(self, path):
+        with self._lock_with_log():
+            if self.isfile(path):
+                self._meta[path].pop("content", None)
 
     def getid(self, path):
         return self._meta[path]["id"]
 
+    def getversion(self, path):
+        return _version(self.getmeta(path))
+
     def getmeta(self, path):
         if not self.has(path):
             raise TypeError("Path not exist")
         return self._meta[path]
 
+    def hascontent(self, path):
+        return self.isfile(path) and "content" in self._meta[path]
+
     def getcontent(self, path):
         if not self.isfile(path):
             raise TypeError("Path is not file")
-        content = getattr(self._meta[path], "content")
+        content = self._meta[path].get("content")
         if content is None:
             raise RuntimeError("Content not loaded")
         return content
 
+    def _update(self, path, meta):
+        old = self._meta.get(path)
+        if old is not None and old["id"] == meta["id"]:
+            # Same entry, keep the listing of a loaded dir
+            if "children" in old:
+                meta["children"] = old["children"]
+            # and the content of an unchanged file
+            if "content" in old and _same_version(old, meta):
+                meta["content"] = old["content"]
+        elif old is not None:
+            self._remove(path)
+        self._paths[path] = meta
+        self._meta[path] = meta
+
+    def _remove(self, path):
+        self._paths.pop(path, None)
+        meta = self._meta.pop(path, None)
+        if meta is None:
+            return
+        for name in meta.get("children", ()):
+            self._remove(os.path.join(path, name))
+
     @contextmanager
     def _lock_with_log(self):
         with self._meta_lock:
             logger.info("Enter lock")
             yield
             logger.info("Leave lock")
+
+
+def _same_version(old, new):
+    return old.get("ctime") == new.get("ctime") and old.get("size") == new.get("size")
+
+
+def _version(meta):
+    return (meta["id"], meta.get("ctime"), meta.get("size"))
@@ -4,12 +4,12 @@
 import errno
 import os
 from stat import S_IFDIR, S_IFREG
-from dateutil import parser as dateparser
 from logging import getLogger
 from fuse import Operations, LoggingMixIn, FuseOSError
 from .fileoper import truncate
 from .decorator import catch_client_exceptions, retryable, nonretryable
 from io import BytesIO
+from threading import Lock
 
 logger = getLogger("DFSFuse")
 
@@ -20,6 +20,7 @@ class DFSFuse(LoggingMixIn, Operations):
         self._client = client
         self._config = config
         self._fhs = []
+        self._versions = {}
 
     @retryable
     def access(self, path, mode):
@@ -48,7 +49,7 @@ class DFSFuse(LoggingMixIn, Operations):
 
         meta = self._client.stat(path)
         logger.info("getattr: meta: %s", meta)
-        time = int(dateparser.parse(meta["ctime"]).timestamp())
+        time = _timestamp(meta["ctime"])
 
         mode = 0o750
         # Here must set file type
@@ -127,7 +128,9 @@ class DFSFuse(LoggingMixIn, Operations):
     # ============
 
     @nonretryable
-    def open(self, path, flags):
+    def open(self, path, fi):
+        flags = fi.flags
+        io = None
         if flags & os.O_RDONLY:
             if self.has(path):
                 raise FuseOSError(errno.ENOENT)
@@ -136,34 +139,70 @@ class DFSFuse(LoggingMixIn, Operations):
                 raise FuseOSError(errno.ENOENT)
             if not (flags & os.O_APPEND):
                 self._client.write(path, "")
+                io = BytesIO()
         length = len(self._fhs)
-        self._fhs.append({"io": BytesIO(self._client.read(path)), "dirty": False})
+        self._fhs.append({"io": io, "dirty": False, "lock": Lock()})
         logger.debug("open file return: %s", length)
-        return length
+        fi.fh = length
+        fi.keep_cache = self._keep_cache(path)
+        fi.direct_io = self._config.direct_io
+        return 0
+
+    def _keep_cache(self, path):
+        # The kernel page cache is only reused while the file is unchanged
+        # since the last open, as far as the client cache can tell
+        version = self._client.version(path)
+        last = self._versions.get(path)
+        self._versions[path] = version
+        return version is not None and version == last
+
+    def _io(self, path, fh):
+        # Content is fetched by the first read or write, an open served from
+        # the kept page cache never needs it
+        handle = self._fhs[fh]
+        with handle["lock"]:
+            if handle["io"] is None:
+                handle["io"] = self._load(path)
+        return handle["io"]
+
+    def _load(self, path):
+        # Large files go to an mmap backed temp file instead of the heap
+        if self._client.spooled(path):
+            return self._client.read_spool(path)
+        return BytesIO(self._client.read(path))
 
     def create(self, path, mode, fi=None):
         self._client.write(path, "")
         length = len(self._fhs)
-        self._fhs.append({"io": BytesIO(), "dirty": False})
-        return length
+        self._fhs.append({"io": BytesIO(), "dirty": False, "lock": Lock()})
+        fi.fh = length
+        fi.direct_io = self._config.direct_io
+        return 0
 
     @retryable
-    def read(self, path, length, offset, fh):
-        self._fhs[fh]["io"].seek(offset)
-        return self._fhs[fh]["io"].read(length)
+    def read(self, path, length, offset, fi):
+        io = self._io(path, fi.fh)
+        io.seek(offset)
+        return io.read(length)
 
     @retryable
-    def write(self, path, buf, offset, fh):
+    def write(self, path, buf, offset, fi):
+        fh = fi.fh
+        io = self._io(path, fh)
         self._fhs[fh]["dirty"] = True
-        self._fhs[fh]["io"].seek(offset)
-        return self._fhs[fh]["io"].write(buf)
+        io.seek(offset)
+        length = io.write(buf)
+        self._fhs[fh]["io"] = self._client.spill(io)
+        return length
 
     @nonretryable
-    def release(self, path, fh):
+    def release(self, path, fi):
+        fh = fi.fh
         if self._fhs[fh]["dirty"]:
-            self._fhs[fh]["io"].seek(0)
-            self._client.write(path, self._fhs[fh]["io"].read())
-        self._fhs[fh]["io"].close()
+            with self._fhs[fh]["io"].getbuffer() as content:
+                self._client.write(path, content)
+        if self._fhs[fh]["io"] is not None:
+            self._fhs[fh]["io"].close()
         return 0
 
     @retryable
@@ -174,3 +213,10 @@ class DFSFuse(LoggingMixIn, Operations):
 
     def destroy(self, path):
         self._client.close()
+
+
+def _timestamp(value):
+    # dateutil is slow to import, load it once the mount is up
+    from dateutil import parser as dateparser
+
+    return int(dateparser.parse(value).timestamp())
@@ -11,6 +11,7 @@ class Packet:
     def __init__(self, header={}, body=b""):
         self.header = {}
         self.header.update(header)
+        self.rest = b""
         self.set(body)
 
     def set(self, header, value=None):
@@ -37,18 +38,23 @@ class Packet:
 
     def to_bytes(self):
         logger.info("To bytes")
-        logger.info("Header: %s", self.header)
         logger.info("Body: %s", self._body)
+        return self.header_bytes() + self.body_bytes()
+
+    def header_bytes(self):
+        logger.info("Header: %s", self.header)
         header = {k: v for k, v in self.header.items() if v is not None}
         s = b""
         for x in header:
             s += x.encode("utf-8") + b": " + str(self.header[x]).encode("utf-8") + b"\n"
         s += b"\n"
+        return s
+
+    def body_bytes(self):
         body = self._body
-        if type(body) is not bytes:
+        if type(body) is str:
             body = bytearray(body, "utf-8")
-        s += body
-        return s
+        return body
 
     def check(self):
         length = int(self.get("content-length"))
@@ -61,10 +67,13 @@ class Packet:
 
     def _set_body(self, buf):
         length = int(self.get("content-length"))
-        self._body = self._body + buf
-        content = self._body
-        if len(content) > length:
-            self._body = content[0:length]
+        # Grow in place, concatenating bytes is quadratic for large bodies
+        if type(self._body) is not bytearray:
+            self._body = bytearray(self._body)
+        self._body += buf
+        if len(self._body) > length:
+            self.rest = bytes(self._body[length:])
+            del self._body[length:]
 
     @staticmethod
     def parse(pkt, raw):
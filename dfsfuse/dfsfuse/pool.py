@@ -0,0 +1,67 @@
+import select
+from contextlib import contextmanager
+from threading import Lock
+from logging import getLogger
+
+logger = getLogger("ConnectionPool")
+
+
+class ConnectionPool:
+    def __init__(self, connect, size=4):
+        self._connect = connect
+        self._size = size
+        self._lock = Lock()
+        self._idle = []
+
+    @contextmanager
+    def connection(self, fresh=False):
+        # Also tells whether the socket was idle in the pool, such a socket
+        # may have been closed by the peer after the check
+        if fresh:
+            sock, reused = self._connect(), False
+        else:
+            sock, reused = self._get()
+        try:
+            yield sock, reused
+        except BaseException:
+            # The stream may be left in the middle of a packet, never reuse it
+            sock.close()
+            raise
+        self._put(sock)
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        logger.info("Drop %s idle connections", len(idle))
+        for sock in idle:
+            sock.close()
+
+    def _get(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                sock = self._idle.pop()
+            if self._alive(sock):
+                return sock, True
+            logger.info("Drop dead idle connection")
+            sock.close()
+        return self._connect(), False
+
+    def _put(self, sock):
+        with self._lock:
+            if len(self._idle) < self._size:
+                self._idle.append(sock)
+                return
+        sock.close()
+
+    @staticmethod
+    def _alive(sock):
+        # An idle connection has nothing to read, readable means closed by peer.
+        # poll, unlike select, works for fds above FD_SETSIZE
+        poller = select.poll()
+        try:
+            poller.register(sock, select.POLLIN)
+            return not poller.poll(0)
+        except (OSError, ValueError):
+            return False
@@ -0,0 +1,68 @@
+import mmap
+import tempfile
+from logging import getLogger
+
+logger = getLogger("SpoolFile")
+
+ZERO_CHUNK = 1024 * 1024
+
+
+class SpoolFile:
+    def __init__(self, size=0, dir=None):
+        self._file = tempfile.TemporaryFile(dir=dir)
+        self._mmap = None
+        self._capacity = 0
+        self._size = 0
+        self._pos = 0
+        self._reserve(size)
+        self._size = size
+
+    def seek(self, offset):
+        self._pos = offset
+        return offset
+
+    def read(self, length=-1):
+        end = self._size if length < 0 else min(self._size, self._pos + length)
+        if self._pos >= end:
+            return b""
+        data = self._mmap[self._pos:end]
+        self._pos = end
+        return data
+
+    def write(self, data):
+        end = self._pos + len(data)
+        self._reserve(end)
+        if self._pos > self._size:
+            self._zero(self._size, self._pos)
+        self._mmap[self._pos:end] = data
+        self._pos = end
+        self._size = max(self._size, end)
+        return len(data)
+
+    def getbuffer(self):
+        if self._mmap is None:
+            return memoryview(b"")
+        return memoryview(self._mmap)[: self._size]
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+    def _reserve(self, size):
+        if size <= self._capacity:
+            return
+        capacity = max(size, self._capacity * 2)
+        logger.info("Grow spool to %s", capacity)
+        # The file stays sparse, untouched pages take no disk or memory
+        if self._mmap is None:
+            self._file.truncate(capacity)
+            self._mmap = mmap.mmap(self._file.fileno(), capacity)
+        else:
+            self._mmap.resize(capacity)
+        self._capacity = capacity
+
+    def _zero(self, start, end):
+        for offset in range(start, end, ZERO_CHUNK):
+            stop = min(end, offset + ZERO_CHUNK)
+            self._mmap[offset:stop] = bytes(stop - offset)
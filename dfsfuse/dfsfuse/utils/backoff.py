@@ -0,0 +1,21 @@
+import random
+from threading import Lock
+
+
+class Backoff:
+    def __init__(self, base=0.1, cap=10):
+        self._base = base
+        self._cap = cap
+        self._lock = Lock()
+        self._attempt = 0
+
+    def next(self):
+        with self._lock:
+            ceiling = min(self._cap, self._base * 2 ** self._attempt)
+            self._attempt += 1
+        # Full jitter, spread out clients that lost the server at the same time
+        return random.uniform(0, ceiling)
+
+    def reset(self):
+        with self._lock:
+            self._attempt = 0
@@ -0,0 +1,33 @@
+import time
+from threading import Lock
+from ..exception import CircuitOpenError
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=5, cooldown=30):
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._lock = Lock()
+        self._failures = 0
+        self._opened_at = None
+
+    def check(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self._cooldown:
+                raise CircuitOpenError("Circuit open")
+            # Half open, the next failure opens it again
+            self._opened_at = None
+            self._failures = self._threshold - 1
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self._threshold:
+                self._opened_at = time.monotonic()
@@ -1,18 +1,61 @@
 import os
 import argparse
-from logging import getLogger, WARNING
-from fuse import FUSE
-from dfsfuse import DFSFuse, Client
+import logging
+from logging import getLogger, DEBUG, WARNING
+from . import FORMAT
 
 
 def run_fuse(args):
+    # Imported here so argument errors and --help don't pay for them
+    from fuse import FUSE
+    from .dfsfuse import DFSFuse, Client
+
     logger = getLogger("FUSE")
     logger.info("Run fuse")
     if not args.debug:
         getLogger("Packet").setLevel(WARNING)
-    client = Client(host=args.host, port=args.port, psk=args.key, cache=args.nocache)
+    client = Client(
+        host=args.host,
+        port=args.port,
+        psk=args.key,
+        cache=args.nocache,
+        timeout=args.timeout,
+        chunk_size=args.chunk_size,
+        parallel=args.parallel,
+        min_staleness=args.min_staleness,
+        max_staleness=args.max_staleness,
+        pipeline=args.pipeline,
+        prefetch=args.prefetch,
+        prefetch_size=args.prefetch_size,
+        spool_size=args.spool_size,
+        spool_dir=args.spool_dir,
+        lazy=args.fast_start,
+    )
+
+    FUSE(
+        DFSFuse(client, args),
+        args.mount,
+        foreground=True,
+        raw_fi=True,
+        **fuse_options(args)
+    )
 
-    FUSE(DFSFuse(client, args), args.mount, foreground=True)
+
+def fuse_options(args):
+    # The kernel must not cache longer than the client trusts its own cache
+    timeout = args.min_staleness if args.nocache else 0
+    options = {
+        "attr_timeout": timeout,
+        "entry_timeout": timeout,
+        "negative_timeout": timeout,
+        "big_writes": True,
+        "max_write": args.max_write,
+        "max_readahead": args.max_readahead,
+    }
+    for name in ("attr_timeout", "entry_timeout", "negative_timeout"):
+        if getattr(args, name) is not None:
+            options[name] = getattr(args, name)
+    return options
 
 
 def main(argv):
@@ -34,5 +77,108 @@ def main(argv):
         "--nocache", help="Disable cache", action="store_false", default=True
     )
 
+    parser.add_argument(
+        "-t", "--timeout", help="Socket timeout per chunk", default=5, type=float
+    )
+
+    parser.add_argument(
+        "--chunk-size", help="Transfer chunk size", default=256 * 1024, type=int
+    )
+
+    parser.add_argument(
+        "--parallel", help="Max parallel transfers", default=4, type=int
+    )
+
+    parser.add_argument(
+        "--min-staleness",
+        help="Seconds before a used dir is revalidated in background",
+        default=5,
+        type=float,
+    )
+
+    parser.add_argument(
+        "--max-staleness",
+        help="Max seconds a cached dir is served without revalidation",
+        default=30,
+        type=float,
+    )
+
+    parser.add_argument(
+        "--pipeline",
+        help="Batched requests in flight per connection",
+        default=1,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--prefetch",
+        help="Siblings fetched on a sequential scan, 0 to disable",
+        default=32,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--prefetch-size",
+        help="Max size of a prefetched file",
+        default=64 * 1024,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--spool-size",
+        help="Open files larger than this are kept in an mmap temp file",
+        default=8 * 1024 * 1024,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--spool-dir", help="Directory for spool files", default=None, type=str
+    )
+
+    parser.add_argument(
+        "--attr-timeout",
+        help="Seconds the kernel caches attributes, default --min-staleness",
+        default=None,
+        type=float,
+    )
+
+    parser.add_argument(
+        "--entry-timeout",
+        help="Seconds the kernel caches names, default --min-staleness",
+        default=None,
+        type=float,
+    )
+
+    parser.add_argument(
+        "--negative-timeout",
+        help="Seconds the kernel caches missing names, default --min-staleness",
+        default=None,
+        type=float,
+    )
+
+    parser.add_argument(
+        "--max-write", help="Max size of a write request", default=128 * 1024, type=int
+    )
+
+    parser.add_argument(
+        "--max-readahead", help="Max kernel readahead", default=1024 * 1024, type=int
+    )
+
+    parser.add_argument(
+        "--direct-io",
+        help="Bypass the kernel page cache for file content",
+        action="store_true",
+        default=False,
+    )
+
+    parser.add_argument(
+        "--fast-start",
+        help="Mount without waiting for the server, list root in background",
+        action="store_true",
+        default=False,
+    )
+
     args = parser.parse_args()
+    logging.basicConfig(format=FORMAT, level=DEBUG)
+    getLogger("bootstrap").info("start")
     run_fuse(args)
@@ -0,0 +1,65 @@
+import pytest
+from dfsfuse.dfsfuse.utils import circuit
+from dfsfuse.dfsfuse.utils.circuit import CircuitBreaker
+from dfsfuse.dfsfuse.exception import CircuitOpenError
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(circuit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_opens_after_threshold_failures(clock):
+    breaker = CircuitBreaker(threshold=3, cooldown=10)
+    for _ in range(2):
+        breaker.failure()
+        breaker.check()
+    breaker.failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_success_resets_failures(clock):
+    breaker = CircuitBreaker(threshold=3, cooldown=10)
+    breaker.failure()
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    breaker.failure()
+    breaker.check()
+
+
+def test_half_open_after_cooldown(clock):
+    breaker = CircuitBreaker(threshold=3, cooldown=10)
+    for _ in range(3):
+        breaker.failure()
+    clock[0] += 9
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    clock[0] += 1
+    breaker.check()
+
+
+def test_half_open_failure_opens_again(clock):
+    breaker = CircuitBreaker(threshold=3, cooldown=10)
+    for _ in range(3):
+        breaker.failure()
+    clock[0] += 10
+    breaker.check()
+    breaker.failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_half_open_success_closes(clock):
+    breaker = CircuitBreaker(threshold=3, cooldown=10)
+    for _ in range(3):
+        breaker.failure()
+    clock[0] += 10
+    breaker.check()
+    breaker.success()
+    breaker.failure()
+    breaker.failure()
+    breaker.check()
@@ -0,0 +1,215 @@
+import json
+import socket
+import threading
+import pytest
+from dfsfuse.dfsfuse.client import Client
+from dfsfuse.dfsfuse.exception import (
+    TimeoutError,
+    DisconnectError,
+    CircuitOpenError,
+)
+from dfsfuse.dfsfuse.packet import Packet
+
+
+class Server:
+    """In-process DFS, each connection is a socket pair served by a thread"""
+
+    def __init__(self):
+        self.nodes = {1: {"name": "/", "type": "dir", "parent": 1}}
+        self.data = {}
+        self.requests = []
+        self.hangup = 0
+        self.mute = False
+        self.lock = threading.Lock()
+        self.peers = []
+
+    def add(self, parent, name, type="file", data=b""):
+        id = max(self.nodes) + 1
+        self.nodes[id] = {"name": name, "type": type, "parent": parent}
+        if type == "file":
+            self.data[id] = data
+        return id
+
+    def connect(self, timeout):
+        sock, peer = socket.socketpair()
+        sock.settimeout(timeout)
+        self.peers.append(peer)
+        threading.Thread(target=self.serve, args=(peer,), daemon=True).start()
+        return sock
+
+    def close(self):
+        for peer in self.peers:
+            peer.close()
+
+    def serve(self, peer):
+        buf = b""
+        while True:
+            while True:
+                pkt = Packet.parse(None, buf) if b"\n\n" in buf else None
+                if pkt is not None and pkt.check():
+                    break
+                try:
+                    data = peer.recv(4096)
+                except OSError:
+                    return
+                if not data:
+                    return
+                buf += data
+            buf = pkt.rest
+            with self.lock:
+                if self.hangup:
+                    self.hangup -= 1
+                    peer.close()
+                    return
+                self.requests.append(pkt.headers)
+                self.body = bytes(pkt.body)
+                if self.mute:
+                    continue
+                header, body = self.handle(pkt.headers)
+            peer.sendall(Packet(header, body).to_bytes())
+
+    def handle(self, header):
+        action = "{0}#{1}".format(header["controller"], header["action"])
+        id = int(header.get("id") or 1)
+        if action == "dir#list":
+            return {"result": "OK"}, self.listing(id)
+        if action == "file#get":
+            return {"result": "OK"}, self.data[id]
+        if action == "file#put":
+            children = self.children(id)
+            name = header["name"]
+            if name in children:
+                self.data[children[name]] = self.body
+            else:
+                self.add(id, name, data=self.body)
+        if action in ("file#mvfile", "dir#mvdir"):
+            self.nodes[id]["parent"] = int(header["pdid"])
+            self.nodes[id]["name"] = header["name"]
+        return {"result": "OK"}, b"OK"
+
+    def entry(self, id):
+        meta = {"id": id, "type": self.nodes[id]["type"], "ctime": "2018"}
+        if id in self.data:
+            meta["size"] = len(self.data[id])
+        return meta
+
+    def children(self, id):
+        return {
+            node["name"]: child
+            for child, node in self.nodes.items()
+            if node["parent"] == id and child != id
+        }
+
+    def listing(self, id):
+        content = {".": self.entry(id), "..": self.entry(self.nodes[id]["parent"])}
+        for name, child in self.children(id).items():
+            content[name] = self.entry(child)
+        return json.dumps(content).encode("utf-8")
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = Server()
+    monkeypatch.setattr(Client, "_connect", lambda self: server.connect(self._timeout))
+    yield server
+    server.close()
+
+
+def make_client(monkeypatch, **kargs):
+    # No revalidation thread, the tests look at what each call sends
+    monkeypatch.setattr(Client, "_schedule", lambda self: None)
+    return Client(**kargs)
+
+
+def test_retry_when_idle_connection_closed(monkeypatch, server):
+    c = make_client(monkeypatch)
+    server.hangup = 1
+
+    assert c.readdir("/") == [".", ".."]
+
+
+def test_no_retry_on_fresh_connection(monkeypatch, server):
+    c = make_client(monkeypatch)
+    c.close()
+    server.hangup = 1
+
+    with pytest.raises(DisconnectError):
+        c.readdir("/")
+
+
+def test_timeouts_open_the_circuit(monkeypatch, server):
+    c = make_client(monkeypatch, timeout=0.05)
+    server.mute = True
+    c.close()
+    for _ in range(5):
+        with pytest.raises(TimeoutError):
+            c.readdir("/")
+    sent = len(server.requests)
+
+    with pytest.raises(CircuitOpenError):
+        c.readdir("/")
+    assert len(server.requests) == sent
+
+
+def test_connect_timeout_closes_socket(monkeypatch):
+    socks = []
+
+    def connect(sock, address):
+        socks.append(sock)
+        raise socket.timeout("timed out")
+
+    monkeypatch.setattr(socket.socket, "connect", connect)
+    c = make_client(monkeypatch, lazy=True)
+    with pytest.raises(DisconnectError):
+        c._connect()
+    assert socks and all(sock.fileno() == -1 for sock in socks)
+
+
+@pytest.mark.parametrize("new", ["/d/b", "/e/b"])
+def test_mv_relists_both_parents(monkeypatch, server, new):
+    d = server.add(1, "d", "dir")
+    server.add(1, "e", "dir")
+    server.add(d, "a", data=b"a")
+    c = make_client(monkeypatch)
+    assert c.has("/d/a")
+    assert c.readdir("/e") == [".", ".."]
+
+    assert c.mv("/d/a", new)
+
+    assert c.has(new)
+    assert not c.has("/d/a")
+    for parent_path in ("/d", "/e"):
+        names = ["b"] if new == parent_path + "/b" else []
+        assert c.readdir(parent_path) == [".", ".."] + names
+
+
+def test_nocache_relists_only_on_miss(monkeypatch, server):
+    d = server.add(1, "d", "dir")
+    server.add(d, "a")
+    c = make_client(monkeypatch, cache=False)
+    assert c.has("/d/a")
+    sent = len(server.requests)
+
+    assert c.has("/d/a")
+    assert len(server.requests) == sent
+    assert not c.has("/d/b")
+    assert len(server.requests) == sent + 1
+
+
+def test_prefetch_does_not_overwrite_newer_write(monkeypatch, server):
+    d = server.add(1, "d", "dir")
+    server.add(d, "a", data=b"old")
+    c = make_client(monkeypatch)
+    assert c.has("/d/a")
+    request_many = Client.request_many
+
+    def write_in_flight(self, sock, requests):
+        responses = request_many(self, sock, requests)
+        c.write("/d/a", b"newer")
+        return responses
+
+    monkeypatch.setattr(Client, "request_many", write_in_flight)
+    c._get_group(["/d/a"], best_effort=True)
+    monkeypatch.setattr(Client, "request_many", request_many)
+
+    assert c.read("/d/a") == b"newer"
@@ -0,0 +1,81 @@
+from dfsfuse.dfsfuse.memoryfs import MemoryFS
+
+
+def entry(id, type="file", ctime="2018-01-01T00:00:00", size=1):
+    meta = {"id": id, "type": type, "ctime": ctime}
+    if type == "file":
+        meta["size"] = size
+    return meta
+
+
+def listing(id, **children):
+    content = {".": entry(id, "dir"), "..": entry(1, "dir")}
+    content.update(children)
+    return content
+
+
+def make_fs():
+    fs = MemoryFS()
+    fs.adddir("/", listing(1, d=entry(2, "dir"), a=entry(3)))
+    fs.adddir("/d", listing(2, x=entry(4), e=entry(5, "dir")))
+    fs.adddir("/d/e", listing(5, y=entry(6)))
+    return fs
+
+
+def test_relist_keeps_loaded_subdirs():
+    fs = make_fs()
+    fs.adddir("/", listing(1, d=entry(2, "dir"), a=entry(3)))
+    assert fs.isloaded("/d")
+    assert sorted(fs.readdir("/d")) == ["e", "x"]
+    assert fs.has("/d/e/y")
+
+
+def test_relist_keeps_content_of_unchanged_file():
+    fs = make_fs()
+    fs.loadfile("/a", b"data")
+    fs.adddir("/", listing(1, d=entry(2, "dir"), a=entry(3)))
+    assert fs.getcontent("/a") == b"data"
+
+
+def test_relist_drops_content_of_changed_file():
+    fs = make_fs()
+    fs.loadfile("/a", b"data")
+    fs.adddir("/", listing(1, d=entry(2, "dir"), a=entry(3, size=2)))
+    assert not fs.hascontent("/a")
+    fs.loadfile("/a", b"data")
+    fs.adddir("/", listing(1, d=entry(2, "dir"), a=entry(3, ctime="later", size=2)))
+    assert not fs.hascontent("/a")
+
+
+def test_relist_removes_vanished_subtree():
+    fs = make_fs()
+    fs.adddir("/", listing(1, a=entry(3)))
+    assert not fs.has("/d")
+    assert not fs.has("/d/x")
+    assert not fs.has("/d/e/y")
+    assert sorted(fs.dirs()) == ["/"]
+
+
+def test_relist_replaces_entry_with_new_id():
+    fs = make_fs()
+    fs.adddir("/", listing(1, d=entry(7, "dir"), a=entry(3)))
+    assert fs.getid("/d") == 7
+    assert not fs.isloaded("/d")
+    assert not fs.has("/d/x")
+    assert not fs.has("/d/e/y")
+
+
+def test_dirs_lists_loaded_dirs_only():
+    fs = MemoryFS()
+    fs.adddir("/", listing(1, d=entry(2, "dir")))
+    assert fs.dirs() == ["/"]
+
+
+def test_loadfile_drops_content_of_older_version():
+    fs = make_fs()
+    version = fs.getversion("/a")
+    fs.adddir("/", listing(1, d=entry(2, "dir"), a=entry(3, size=2)))
+    assert not fs.loadfile("/a", b"x", version)
+    assert not fs.hascontent("/a")
+    assert fs.loadfile("/a", b"xy", fs.getversion("/a"))
+    assert fs.getcontent("/a") == b"xy"
@@ -0,0 +1,77 @@
+import os
+from types import SimpleNamespace
+from dfsfuse.dfsfuse.operations import DFSFuse
+
+
+class FakeClient:
+    def __init__(self, content):
+        self.content = content
+        self.reads = 0
+        self.writes = []
+
+    def version(self, path):
+        return (2, "2018", len(self.content))
+
+    def spooled(self, path):
+        return False
+
+    def read(self, path):
+        self.reads += 1
+        return self.content
+
+    def write(self, path, content):
+        if type(content) is str:
+            content = content.encode("utf-8")
+        self.writes.append(bytes(content))
+
+    def spill(self, io):
+        return io
+
+
+def make_fs(content=b"0123456789"):
+    config = SimpleNamespace(direct_io=False, uid=0, gid=0)
+    client = FakeClient(content)
+    return DFSFuse(client, config), client
+
+
+def fi(flags=os.O_RDONLY):
+    return SimpleNamespace(flags=flags, fh=None, keep_cache=False, direct_io=False)
+
+
+def test_open_does_not_fetch_content():
+    fs, client = make_fs()
+    for _ in range(2):
+        info = fi()
+        fs.open("/a", info)
+        fs.release("/a", info)
+    assert info.keep_cache
+    assert client.reads == 0
+
+
+def test_first_read_fetches_once():
+    fs, client = make_fs()
+    info = fi()
+    fs.open("/a", info)
+    assert fs.read("/a", 4, 0, info) == b"0123"
+    assert fs.read("/a", 4, 6, info) == b"6789"
+    fs.release("/a", info)
+    assert client.reads == 1
+
+
+def test_append_loads_before_write():
+    fs, client = make_fs(b"abc")
+    info = fi(os.O_WRONLY | os.O_APPEND)
+    fs.open("/a", info)
+    fs.write("/a", b"de", 3, info)
+    fs.release("/a", info)
+    assert client.writes == [b"abcde"]
+
+
+def test_truncating_open_skips_fetch():
+    fs, client = make_fs(b"abc")
+    info = fi(os.O_WRONLY)
+    fs.open("/a", info)
+    fs.write("/a", b"xy", 0, info)
+    fs.release("/a", info)
+    assert client.reads == 0
+    assert client.writes == [b"", b"xy"]
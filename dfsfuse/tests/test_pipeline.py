@@ -0,0 +1,78 @@
+import socket
+import pytest
+from dfsfuse.dfsfuse.client import Client
+from dfsfuse.dfsfuse.exception import DisconnectError
+from dfsfuse.dfsfuse.packet import Packet
+
+
+@pytest.fixture
+def pair():
+    client, server = socket.socketpair()
+    client.settimeout(5)
+    yield client, server
+    client.close()
+    server.close()
+
+
+def make_client(monkeypatch, **kargs):
+    monkeypatch.setattr(Client, "_preload", lambda self: None)
+    return Client(cache=False, lazy=True, **kargs)
+
+
+def read_requests(sock, count):
+    buf = b""
+    pkts = []
+    while len(pkts) < count:
+        buf += sock.recv(4096)
+        while b"\n\n" in buf:
+            pkt = Packet.parse(None, buf)
+            if not pkt.check():
+                break
+            pkts.append(pkt)
+            buf = pkt.rest
+    return pkts
+
+
+@pytest.mark.parametrize("chunk_size", [7, 64, 4096])
+def test_responses_sharing_a_recv(monkeypatch, pair, chunk_size):
+    client, server = pair
+    c = make_client(monkeypatch, chunk_size=chunk_size, pipeline=3)
+    bodies = [b"first", b"has\n\nblank line", b""]
+    responses = [Packet({"result": "OK"}, body).to_bytes() for body in bodies]
+    server.sendall(b"".join(responses))
+
+    requests = [("file#get", {"id": id}, b"") for id in (2, 3, 4)]
+    responses = c.request_many(client, requests)
+
+    assert [bytes(body) for _, body in responses] == bodies
+    assert [pkt.get("id") for pkt in read_requests(server, 3)] == ["2", "3", "4"]
+
+
+def test_windows_smaller_than_batch(monkeypatch, pair):
+    client, server = pair
+    c = make_client(monkeypatch, chunk_size=16, pipeline=2)
+    server.sendall(b"".join(Packet({"n": n}, b"x" * n).to_bytes() for n in range(5)))
+
+    responses = c.request_many(client, [("file#get", {"id": n}, b"") for n in range(5)])
+
+    assert [header["n"] for header, _ in responses] == ["0", "1", "2", "3", "4"]
+    assert [len(body) for _, body in responses] == [0, 1, 2, 3, 4]
+
+
+def test_disconnect_mid_batch(monkeypatch, pair):
+    client, server = pair
+    c = make_client(monkeypatch, pipeline=2)
+    server.sendall(Packet({"result": "OK"}, b"only one").to_bytes())
+    server.shutdown(socket.SHUT_WR)
+
+    with pytest.raises(DisconnectError):
+        c.request_many(client, [("file#get", {"id": n}, b"") for n in range(2)])
+
+
+def test_rest_keeps_bytes_past_the_packet():
+    first = Packet({"result": "OK"}, b"abc").to_bytes()
+    second = Packet({"result": "OK"}, b"de").to_bytes()
+    pkt = Packet.parse(None, first + second[:5])
+    assert pkt.check()
+    assert bytes(pkt.body) == b"abc"
+    assert pkt.rest == second[:5]
@@ -0,0 +1,84 @@
+import socket
+import pytest
+from dfsfuse.dfsfuse.pool import ConnectionPool
+
+
+class Server:
+    def __init__(self):
+        self.peers = []
+
+    def connect(self):
+        sock, peer = socket.socketpair()
+        self.peers.append(peer)
+        return sock
+
+    def close(self):
+        for peer in self.peers:
+            peer.close()
+
+
+@pytest.fixture
+def server():
+    server = Server()
+    yield server
+    server.close()
+
+
+def test_reuses_idle_connection(server):
+    pool = ConnectionPool(server.connect)
+    with pool.connection() as (first, reused):
+        assert not reused
+    with pool.connection() as (second, reused):
+        assert reused
+    assert first is second
+    assert len(server.peers) == 1
+
+
+def test_drops_dead_idle_connection(server):
+    pool = ConnectionPool(server.connect)
+    with pool.connection() as (first, _):
+        pass
+    server.peers[0].close()
+
+    with pool.connection() as (second, reused):
+        assert not reused
+    assert second is not first
+    assert first.fileno() == -1
+
+
+def test_fresh_skips_idle(server):
+    pool = ConnectionPool(server.connect)
+    with pool.connection() as (first, _):
+        pass
+    with pool.connection(fresh=True) as (second, reused):
+        assert not reused
+    assert second is not first
+
+
+def test_never_reuses_after_error(server):
+    pool = ConnectionPool(server.connect)
+    with pytest.raises(ValueError):
+        with pool.connection() as (first, _):
+            raise ValueError()
+    assert first.fileno() == -1
+
+    with pool.connection() as (second, reused):
+        assert not reused
+    assert second is not first
+
+
+def test_keeps_at_most_size(server):
+    pool = ConnectionPool(server.connect, size=1)
+    with pool.connection() as (first, _):
+        with pool.connection() as (second, _):
+            pass
+        assert second.fileno() != -1
+    assert first.fileno() == -1
+
+
+def test_clear_closes_idle(server):
+    pool = ConnectionPool(server.connect)
+    with pool.connection() as (sock, _):
+        pass
+    pool.clear()
+    assert sock.fileno() == -1
@@ -0,0 +1,89 @@
+import pytest
+from dfsfuse.dfsfuse.spool import SpoolFile, ZERO_CHUNK
+
+
+@pytest.fixture
+def spool(tmp_path):
+    spool = SpoolFile(dir=str(tmp_path))
+    yield spool
+    spool.close()
+
+
+def test_starts_zeroed(tmp_path):
+    spool = SpoolFile(16, dir=str(tmp_path))
+    try:
+        assert spool.read() == bytes(16)
+        assert len(spool.getbuffer()) == 16
+    finally:
+        spool.close()
+
+
+def test_empty(spool):
+    assert spool.read() == b""
+    assert len(spool.getbuffer()) == 0
+
+
+def test_grows_with_small_writes(spool):
+    for n in range(1000):
+        spool.write(b"%04d" % n)
+    assert len(spool.getbuffer()) == 4000
+    spool.seek(3996)
+    assert spool.read() == b"0999"
+    spool.seek(0)
+    assert spool.read(8) == b"00000001"
+
+
+def test_grows_with_large_write(spool):
+    spool.write(b"a")
+    data = bytes(range(256)) * 4096
+    spool.write(data)
+    assert bytes(spool.getbuffer()) == b"a" + data
+
+
+def test_overwrite_keeps_size(spool):
+    spool.write(b"hello world")
+    spool.seek(0)
+    spool.write(b"HELLO")
+    spool.seek(0)
+    assert spool.read() == b"HELLO world"
+    assert len(spool.getbuffer()) == 11
+
+
+@pytest.mark.parametrize("gap", [1, 100, ZERO_CHUNK + 1])
+def test_write_past_end_fills_zero(spool, gap):
+    spool.write(b"abc")
+    spool.seek(3 + gap)
+    spool.write(b"z")
+    spool.seek(0)
+    assert spool.read() == b"abc" + bytes(gap) + b"z"
+
+
+def test_rewrite_after_gap_keeps_zeros(spool):
+    spool.write(b"x" * 10)
+    spool.seek(20)
+    spool.write(b"y")
+    spool.seek(5)
+    spool.write(b"z")
+    assert bytes(spool.getbuffer()) == b"x" * 5 + b"z" + b"x" * 4 + bytes(10) + b"y"
+
+
+def test_read_length(spool):
+    spool.write(b"0123456789")
+    spool.seek(2)
+    assert spool.read(3) == b"234"
+    assert spool.read(100) == b"56789"
+    assert spool.read(1) == b""
+
+
+def test_read_past_end(spool):
+    spool.write(b"abc")
+    spool.seek(10)
+    assert spool.read() == b""
+
+
+def test_close_after_buffer_released(tmp_path):
+    spool = SpoolFile(dir=str(tmp_path))
+    spool.write(b"data")
+    with spool.getbuffer() as view:
+        assert bytes(view) == b"data"
+    spool.close()